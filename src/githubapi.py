@@ -3,30 +3,660 @@
 Data source that uses the GitHub API
 """
 
-import json
+import asyncio
+import hashlib
 import re
+import threading
+import time
+import weakref
+from functools import cached_property, wraps
+from urllib.parse import parse_qs, urlparse
+from cachetools import LRUCache, TTLCache, cached
+from cachetools.keys import hashkey
+import httpx
+import numpy as np
+import orjson
 import pandas as pd
 from github import Github
+import redis
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from augur.datasources.localcsv.localcsv import LocalCSV
 from augur import logger
 from augur.util import annotate
 # end imports
 # (don't remove the above line, it's for a script)
 
+class GraphQLError(Exception):
+    """
+    Raised when the GitHub GraphQL API reports errors or returns no data
+    """
+
+# Metric DataFrames computed in the last five minutes
+_metric_cache = TTLCache(maxsize=256, ttl=300)
+_metric_cache_lock = threading.Lock()
+
+def _cached_metric(func):
+    """
+    Serves repeated calls of a metric from the in-process metric cache, keyed on
+    the metric name, the API key and the arguments. Every call gets its own copy
+    of the cached DataFrame, so a caller modifying it can't change what others see.
+
+    :param func: The metric method to decorate
+    :return: The decorated method
+    """
+    def key(self, *args, **kwargs):
+        return hashkey(func.__name__, self.GITHUB_API_KEY, *args, **kwargs)
+
+    cached_func = cached(_metric_cache, key=key, lock=_metric_cache_lock)(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return cached_func(*args, **kwargs).copy()
+
+    return wrapper
+
+def _stop_loop(loop, thread):
+    """
+    Stops an event loop running on a background thread and closes it
+
+    :param loop: The event loop
+    :param thread: The thread running the loop
+    """
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
 class GitHubAPI(object):
     """
     GitHubAPI is a class for getting metrics from the GitHub API
     """
-    def __init__(self, api_key):
+    # Seconds a cached response stays valid: short for endpoints that change
+    # whenever someone touches the repo, long for computed statistics
+    SHORT_CACHE_TTL = 30
+    LONG_CACHE_TTL = 3600
+
+    # Bytes of response bodies an instance keeps to answer 304 Not Modified with
+    ETAG_CACHE_SIZE = 64 * 1024 * 1024
+
+    # Seconds to wait on Redis before treating the cache as unavailable
+    REDIS_TIMEOUT = 1
+
+    # Most requests an instance has in flight at once
+    MAX_CONCURRENCY = 20
+
+    # Times a request is retried after a transient failure, and the statuses that
+    # count as one; a 403 is also retried when GitHub sends Retry-After with it,
+    # which it does for its secondary rate limits
+    MAX_RETRIES = 3
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    # Tokens a request takes from its rate limit bucket. REST limits count
+    # requests; GraphQL limits count points, and every query this class sends
+    # asks for at most ten 100-node connections, which GitHub charges at its
+    # 1 point minimum.
+    REST_REQUEST_COST = 1
+    GRAPHQL_QUERY_COST = 1
+
+    # Token bucket for each API key and rate limit resource, shared by every
+    # instance so they pace themselves together:
+    # [tokens left, epoch second the limit resets, earliest time of the next send]
+    _rate_limits = {}
+    _rate_limit_lock = threading.Lock()
+
+    # Redis client for each cache URL, shared by the instances using that URL so
+    # they draw from one connection pool
+    _redis_clients = {}
+
+    # The name/gender reference data never changes, so build its lookup table once
+    _NAME_GENDER = dict(zip(LocalCSV.name_gender['name'], LocalCSV.name_gender['gender']))
+
+    def __init__(self, api_key, redis_url=None):
         """
         Creates a new GitHub instance
 
         :param api_key: GitHub API key
+        :param redis_url: URL of the Redis server used to cache API responses,
+                          responses are not cached if None
         """
         self.GITHUB_API_KEY = api_key
         self.api = Github(api_key)
 
+        # One keep-alive connection pool for every synchronous request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.MAX_CONCURRENCY,
+                              pool_maxsize=self.MAX_CONCURRENCY,
+                              max_retries=Retry(total=self.MAX_RETRIES, backoff_factor=0.5,
+                                                status_forcelist=self.RETRY_STATUSES))
+        self.session.mount('https://', adapter)
+        self.session.auth = ('user', api_key)
+        self.session.headers['Accept'] = 'application/vnd.github+json'
+
+        # (ETag, body, Link relations) of the latest response per URL, least
+        # recently used evicted first
+        self._etag_cache = LRUCache(maxsize=self.ETAG_CACHE_SIZE,
+                                    getsizeof=lambda entry: len(entry[1]))
+        self._etag_lock = threading.Lock()
+
+        # The async client lives on an event loop of its own, running on a
+        # background thread, so the metrics can be called from threads and from
+        # code that already runs an event loop (e.g. Jupyter)
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._loop_thread.start()
+        self._stop_loop = weakref.finalize(self, _stop_loop, self._loop, self._loop_thread)
+
+        if redis_url is not None and redis_url not in GitHubAPI._redis_clients:
+            GitHubAPI._redis_clients[redis_url] = redis.Redis(
+                connection_pool=redis.ConnectionPool.from_url(
+                    redis_url,
+                    socket_timeout=self.REDIS_TIMEOUT,
+                    socket_connect_timeout=self.REDIS_TIMEOUT))
+        self._redis = GitHubAPI._redis_clients.get(redis_url)
+
+    def close(self):
+        """
+        Closes the HTTP clients and stops the background event loop
+        """
+        if not self._stop_loop.alive:
+            return
+        if '_async_client' in self.__dict__:
+            self._run(self._async_client.aclose())
+        self._stop_loop()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @cached_property
+    def _async_client(self):
+        """
+        Shared HTTP/2 client used for concurrent page fetches, only ever touched
+        from the background event loop
+        """
+        return httpx.AsyncClient(http2=True,
+                                 auth=('user', self.GITHUB_API_KEY),
+                                 headers={'Accept': 'application/vnd.github+json'},
+                                 limits=httpx.Limits(max_keepalive_connections=self.MAX_CONCURRENCY))
+
+    @cached_property
+    def _rate_limiter(self):
+        """
+        Caps the number of async requests in flight, only ever touched from the
+        background event loop
+        """
+        return asyncio.Semaphore(self.MAX_CONCURRENCY)
+
+    def _run(self, coro):
+        """
+        Runs a coroutine on the background event loop and waits for its result.
+        Safe to call from any thread other than the loop's own.
+
+        :param coro: The coroutine to run
+        :return: Whatever the coroutine returns
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _rate_limit_key(self, url):
+        """
+        Key the rate limit of a request is tracked under, GitHub counts REST and
+        GraphQL requests against separate limits
+
+        :param url: The URL of the request
+        :return: Tuple of the API key and the rate limit resource
+        """
+        return self.GITHUB_API_KEY, 'graphql' if url.endswith('/graphql') else 'core'
+
+    def _take_rate_limit_token(self, url):
+        """
+        Takes the tokens for one request from the bucket of its rate limit and
+        works out when the request may be sent. Requests go out at once while
+        more tokens remain than the requests that can be in flight would take.
+        Below that, each request is given its own send slot, spaced so the
+        remaining tokens last until the limit resets. With no tokens left,
+        requests wait for the reset.
+
+        :param url: The URL of the request
+        :return: Seconds to wait before sending the request
+        """
+        key = self._rate_limit_key(url)
+        cost = self.GRAPHQL_QUERY_COST if key[1] == 'graphql' else self.REST_REQUEST_COST
+        with self._rate_limit_lock:
+            now = time.time()
+            bucket = self._rate_limits.get(key)
+            if bucket is None or now >= bucket[1]:
+                # nothing is known about the current window until a response arrives
+                return 0
+
+            tokens, reset, next_send = bucket
+            if tokens < cost:
+                return reset - now
+
+            bucket[0] = tokens = tokens - cost
+            if tokens >= self.MAX_CONCURRENCY * cost:
+                return 0
+
+            send = max(now, next_send)
+            bucket[2] = send + (reset - send) / max(tokens // cost, 1)
+            return send - now
+
+    def _update_rate_limit(self, url, response):
+        """
+        Re-syncs the rate limit bucket with what GitHub reported on a response
+
+        :param url: The URL of the request
+        :param response: The response to the request
+        """
+        if 'X-RateLimit-Remaining' not in response.headers:
+            return
+
+        remaining = int(response.headers['X-RateLimit-Remaining'])
+        reset = int(response.headers['X-RateLimit-Reset'])
+        key = self._rate_limit_key(url)
+        with self._rate_limit_lock:
+            bucket = self._rate_limits.get(key)
+            if bucket is None or bucket[1] != reset:
+                self._rate_limits[key] = [remaining, reset, time.time()]
+            else:
+                # responses of earlier requests can arrive after tokens were taken
+                # for later ones, so never hand back tokens within a window
+                bucket[0] = min(bucket[0], remaining)
+
+    def _request(self, method, url, **kwargs):
+        """
+        Sends a request through the session, pacing it to the rate limit
+
+        :param method: HTTP method of the request
+        :param url: The URL of the request
+        :return: The response
+        """
+        time.sleep(self._take_rate_limit_token(url))
+        response = self.session.request(method, url, **kwargs)
+        self._update_rate_limit(url, response)
+        return response
+
+    def _retry_delay(self, response, attempt):
+        """
+        Seconds to wait before retrying a response, honouring Retry-After and
+        otherwise backing off exponentially
+
+        :param response: The response to the request
+        :param attempt: How many times the request has been retried so far
+        :return: Seconds to wait, or None if the response is not worth retrying
+        """
+        retry_after = response.headers.get('Retry-After')
+        if response.status_code not in self.RETRY_STATUSES and not (
+                response.status_code == 403 and retry_after is not None):
+            return None
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return 0.5 * 2 ** attempt
+
+    async def _async_request(self, method, url, **kwargs):
+        """
+        Sends a request through the async client, pacing it to the rate limit.
+        Transient failures (connection errors, 429, 5xx and secondary rate limit
+        403s) are retried up to MAX_RETRIES times, without holding a concurrency
+        slot while waiting.
+
+        :param method: HTTP method of the request
+        :param url: The URL of the request
+        :return: The response
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            last_attempt = attempt == self.MAX_RETRIES
+            async with self._rate_limiter:
+                await asyncio.sleep(self._take_rate_limit_token(url))
+                try:
+                    response = await self._async_client.request(method, url, **kwargs)
+                except httpx.TransportError:
+                    if last_attempt:
+                        raise
+                    response = None
+
+            if response is None:
+                delay = 0.5 * 2 ** attempt
+            else:
+                self._update_rate_limit(url, response)
+                delay = self._retry_delay(response, attempt)
+                if delay is None or last_attempt:
+                    return response
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _count_per_day(timestamps):
+        """
+        Counts timestamps per UTC day. The timestamps are parsed once and bucketed
+        by casting them to day precision in a single NumPy conversion.
+
+        :param timestamps: ISO 8601 timestamps
+        :return: DataFrame with each day that has timestamps and how many it has
+        """
+        days = pd.to_datetime(timestamps, utc=True).values.astype('datetime64[D]')
+        days, counts = np.unique(days, return_counts=True)
+
+        return pd.DataFrame({'created_at': pd.to_datetime(days.astype('datetime64[ns]'), utc=True),
+                             'count': counts})
+
+    def _cache_key(self, url):
+        """
+        Redis key of a cached response, the API key is part of the hash so users
+        never see each other's responses
+
+        :param url: The URL of the request
+        :return: The key the response is cached under
+        """
+        return 'githubapi:' + hashlib.sha1((url + self.GITHUB_API_KEY).encode()).hexdigest()
+
+    def _cache_read(self, key):
+        """
+        Reads a cached value from Redis. The cache is best effort, so a Redis error
+        counts as a miss and the caller fetches live.
+
+        :param key: The key the value is cached under
+        :return: The cached value, or None on a miss or without Redis
+        """
+        if self._redis is None:
+            return None
+        try:
+            return self._redis.get(key)
+        except redis.RedisError as e:
+            logger.warning('GitHubAPI: reading the Redis cache failed, fetching live: {}'.format(e))
+            return None
+
+    def _cache_write(self, key, ttl, value):
+        """
+        Stores a value in Redis, a Redis error only means the value is not cached
+
+        :param key: The key to cache the value under
+        :param ttl: Seconds the value stays cached
+        :param value: The value to cache
+        """
+        if self._redis is None:
+            return
+        try:
+            self._redis.setex(key, ttl, value)
+        except redis.RedisError as e:
+            logger.warning('GitHubAPI: writing the Redis cache failed: {}'.format(e))
+
+    async def _async_cache_read(self, key):
+        """
+        _cache_read for coroutines, run in the default executor so a slow Redis
+        doesn't block the event loop other requests are running on
+
+        :param key: The key the value is cached under
+        :return: The cached value, or None on a miss or without Redis
+        """
+        if self._redis is None:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(None, self._cache_read, key)
+
+    async def _async_cache_write(self, key, ttl, value):
+        """
+        _cache_write for coroutines, run in the default executor
+
+        :param key: The key to cache the value under
+        :param ttl: Seconds the value stays cached
+        :param value: The value to cache
+        """
+        if self._redis is None:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self._cache_write, key, ttl, value)
+
+    def _conditional_get(self, url):
+        """
+        GETs a URL with If-None-Match set to the ETag of the last response for it.
+        GitHub answers 304 without charging the rate limit when nothing changed,
+        in which case the body of the last response is returned.
+
+        :param url: The URL to fetch
+        :return: Tuple of the raw JSON body and the status code, 200 when the
+                 stored body is reused on a 304
+        """
+        with self._etag_lock:
+            cached_response = self._etag_cache.get(url)
+        headers = {} if cached_response is None else {'If-None-Match': cached_response[0]}
+        response = self._request('GET', url, headers=headers)
+
+        if response.status_code == 304 and cached_response is not None:
+            return cached_response[1], 200
+
+        if (response.status_code == 200 and 'ETag' in response.headers
+                and len(response.content) <= self.ETAG_CACHE_SIZE):
+            with self._etag_lock:
+                self._etag_cache[url] = (response.headers['ETag'], response.content, response.links)
+
+        return response.content, response.status_code
+
+    def _cached_get(self, url, ttl):
+        """
+        GETs a URL, serving the response body from Redis when a copy is cached.
+        Anything but a 200 raises requests.HTTPError, so neither Redis nor the
+        metric cache ever keeps a 202 "still computing" reply or an error body.
+
+        :param url: The URL to fetch
+        :param ttl: Seconds the response body stays cached
+        :return: Raw JSON body of the response
+        """
+        key = self._cache_key(url)
+        content = self._cache_read(key)
+        if content is None:
+            content, status = self._conditional_get(url)
+            if status != 200:
+                raise requests.HTTPError('GitHub answered {} for {}'.format(status, url))
+            self._cache_write(key, ttl, content)
+
+        return content
+
+    async def _async_paginate(self, url, ttl, fields=None):
+        """
+        Fetches every page of a REST list endpoint. The first page is fetched on
+        its own to read the total page count from the `Link: rel="last"` header,
+        then the remaining pages are requested concurrently. Each page is asked
+        for with the ETag of its last response, and a 304, which costs no rate
+        limit, reuses that response's items. The concatenated items are cached
+        in Redis as a whole. A page that does not come back with
+        a success status raises httpx.HTTPStatusError, so error bodies are never
+        taken for, or cached as, an empty list.
+
+        :param url: URL of the list endpoint
+        :param ttl: Seconds the items stay cached
+        :param fields: If given, only these fields of each item are kept, and only
+                       they are cached
+        :return: List with the items of every page concatenated
+        """
+        def parse(response):
+            response.raise_for_status()
+            if not response.content:
+                # 204 No Content, e.g. the contributors of an empty repo
+                return []
+            items = orjson.loads(response.content)
+            if fields is None:
+                return items
+            return [{field: item[field] for field in fields} for item in items]
+
+        key = self._cache_key(url if fields is None else url + '#' + ','.join(fields))
+        content = await self._async_cache_read(key)
+        if content is not None:
+            return orjson.loads(content)
+
+        page_url = url + ('&page=' if '?' in url else '?page=')
+
+        async def fetch(page):
+            # reduce each body to its items as soon as it arrives, so only the
+            # parsed items of the pages are held at once, never every raw body
+            etag_key = page_url + str(page) + ('' if fields is None else '#' + ','.join(fields))
+            with self._etag_lock:
+                cached_response = self._etag_cache.get(etag_key)
+            headers = {} if cached_response is None else {'If-None-Match': cached_response[0]}
+            response = await self._async_request('GET', page_url + str(page), headers=headers)
+
+            if response.status_code == 304 and cached_response is not None:
+                return orjson.loads(cached_response[1]), cached_response[2]
+
+            page_items = parse(response)
+            if 'ETag' in response.headers:
+                # keep the reduced items rather than the raw body, it's all a 304 needs
+                body = orjson.dumps(page_items)
+                if len(body) <= self.ETAG_CACHE_SIZE:
+                    with self._etag_lock:
+                        self._etag_cache[etag_key] = (response.headers['ETag'], body, response.links)
+            return page_items, response.links
+
+        items, links = await fetch(1)
+        last = 1
+        if 'last' in links:
+            last = int(parse_qs(urlparse(links['last']['url']).query)['page'][0])
+
+        pages = await asyncio.gather(*[fetch(page) for page in range(2, last + 1)])
+        for page_items, _ in pages:
+            items += page_items
+
+        await self._async_cache_write(key, ttl, orjson.dumps(items))
+
+        return items
+
+    @staticmethod
+    def _graphql_data(response):
+        """
+        Checks a GraphQL response and returns its data. GitHub reports a missing
+        repository or a bad token as 200 with an `errors` array, so both the status
+        and the body are checked.
+
+        :param response: requests or httpx response to a GraphQL query
+        :return: The `data` object of the response
+        """
+        response.raise_for_status()
+        body = orjson.loads(response.content)
+        if body.get('errors'):
+            raise GraphQLError('; '.join(error.get('message', str(error)) for error in body['errors']))
+        if body.get('data') is None:
+            raise GraphQLError('GitHub returned no data')
+        return body['data']
+
+    def _graphql_nodes(self, query, variables, connection, ttl):
+        """
+        Collects every node of a repository connection through the GraphQL API,
+        following its cursor from page to page. The nodes are cached in Redis as
+        a whole.
+
+        :param query: GraphQL query selecting `nodes` and `pageInfo { endCursor hasNextPage }`
+                      of the connection, with a `$cursor: String` variable for its `after` argument
+        :param variables: Values of the query's other variables
+        :param connection: Name of the connection field under `repository`
+        :param ttl: Seconds the nodes stay cached
+        :return: List with the nodes of every page
+        """
+        url = "https://api.github.com/graphql"
+        key = self._cache_key(url + query + orjson.dumps(variables, option=orjson.OPT_SORT_KEYS).decode())
+        content = self._cache_read(key)
+        if content is not None:
+            return orjson.loads(content)
+
+        nodes = []
+        cursor = None
+        while True:
+            response = self._request('POST', url, json={'query': query,
+                                                        'variables': dict(variables, cursor=cursor)})
+            page = self._graphql_data(response)['repository'][connection]
+            nodes += page['nodes']
+            if not page['pageInfo']['hasNextPage']:
+                break
+            cursor = page['pageInfo']['endCursor']
+
+        self._cache_write(key, ttl, orjson.dumps(nodes))
+
+        return nodes
+
+    async def _async_commit_history(self, owner, repo, field, ttl):
+        """
+        Fetches one author field of every commit on the default branch. A preflight
+        query returns the first page along with the head commit and the total commit
+        count. Commit history cursors have the form "<head oid> <offset>", so the
+        cursors of every remaining page are known up front; those pages are requested
+        as aliased sub-queries, several per POST, and the POSTs are sent concurrently.
+        The values are cached in Redis as a whole.
+
+        :param owner: repo owner username
+        :param repo: repo name
+        :param field: Field of the commit's GitActor author, e.g. email or date
+        :param ttl: Seconds the values stay cached
+        :return: List with the author field of each commit
+        """
+        url = "https://api.github.com/graphql"
+        key = self._cache_key('{}#{}/{}/history/author/{}'.format(url, owner, repo, field))
+        content = await self._async_cache_read(key)
+        if content is not None:
+            return orjson.loads(content)
+
+        page_size = 100   # largest page GitHub serves for a connection
+        pages_per_query = 10
+        # one page of history, aliased c<alias> and starting after the $c<alias> cursor
+        page = """
+            c%(alias)d: repository(name: $repo, owner: $owner) {
+              defaultBranchRef {
+                target {
+                  ... on Commit {
+                    oid
+                    history(first: %(page_size)d, after: $c%(alias)d) {
+                      totalCount
+                      nodes {
+                        author {
+                          %(field)s
+                        }
+                      }
+                    }
+                  }
+                }
+              }
+            }
+        """
+
+        def history_query(pages):
+            # owner, repo and cursors travel as variables, only the number of
+            # aliases and the selected field (both set by this class) shape the text
+            cursors = ''.join(', $c%d: String' % alias for alias in range(pages))
+            return ('query($owner: String!, $repo: String!%s) {' % cursors
+                    + ''.join(page % {'alias': alias, 'page_size': page_size, 'field': field}
+                              for alias in range(pages))
+                    + '}')
+
+        r = await self._async_request('POST', url, json={'query': history_query(1),
+                                                          'variables': {'owner': owner, 'repo': repo,
+                                                                        'c0': None}})
+        branch = self._graphql_data(r)['c0']['defaultBranchRef']
+        if branch is None:
+            raise GraphQLError('{}/{} has no default branch, the repository is empty'.format(owner, repo))
+        target = branch['target']
+        values = [node['author'][field] for node in target['history']['nodes']]
+
+        cursors = ['%s %d' % (target['oid'], offset - 1)
+                   for offset in range(page_size, target['history']['totalCount'], page_size)]
+        full_query = history_query(pages_per_query)
+        posts = []
+        for start in range(0, len(cursors), pages_per_query):
+            batch = cursors[start:start + pages_per_query]
+            variables = {'owner': owner, 'repo': repo}
+            variables.update(('c%d' % alias, cursor) for alias, cursor in enumerate(batch))
+            query = full_query if len(batch) == pages_per_query else history_query(len(batch))
+            posts.append({'query': query, 'variables': variables})
+
+        responses = await asyncio.gather(*[self._async_request('POST', url, json=post)
+                                           for post in posts])
+        for r in responses:
+            for page in self._graphql_data(r).values():
+                values += [node['author'][field]
+                           for node in page['defaultBranchRef']['target']['history']['nodes']]
+
+        await self._async_cache_write(key, ttl, orjson.dumps(values))
+
+        return values
+
     #####################################
     ###    DIVERSITY AND INCLUSION    ###
     #####################################
@@ -37,6 +667,7 @@ class GitHubAPI(object):
     #####################################
 
     @annotate(tag='closed-issues')
+    @_cached_metric
     def closed_issues(self, owner, repo=None):
         """
         Timeseries of the count of the number of issues closed per day
@@ -46,17 +677,30 @@ class GitHubAPI(object):
         :return: DataFrame with newly closed issues/day
         """
 
-        url = "https://api.github.com/repos/{}/{}/issues?state=closed".format(owner, repo)
-        json = requests.get(url, auth=('user', self.GITHUB_API_KEY)).json()
-        df = pd.DataFrame(json, columns=['created_at'])
-
-        df['created_at'] = pd.to_datetime(df['created_at']).dt.normalize()
+        query = """
+            query($owner: String!, $repo: String!, $cursor: String) {
+              repository(name: $repo, owner: $owner) {
+                issues(states: CLOSED, first: 100, after: $cursor) {
+                  nodes {
+                    createdAt
+                  }
+                  pageInfo {
+                    endCursor
+                    hasNextPage
+                  }
+                }
+              }
+            }
+        """
+        issues = self._graphql_nodes(query, {'owner': owner, 'repo': repo}, 'issues',
+                                     ttl=self.SHORT_CACHE_TTL)
 
-        df = df.groupby('created_at').size().reset_index(name='count')
+        df = self._count_per_day([issue['createdAt'] for issue in issues])
 
         return df
 
     @annotate(tag='code-commits')
+    @_cached_metric
     def code_commits(self, owner, repo):
         """
         Timeseries of the count of code commits per day.
@@ -65,28 +709,16 @@ class GitHubAPI(object):
         :param repo: The name of the repo.
         :return: DataFrame with code commits/day.
         """
-        i = 0
-        url = "https://api.github.com/repos/{}/{}/commits?page={}"
-        json = []
-
-        # Paginate through all the code commits
-        while True:
-            j = requests.get(url.format(owner, repo, i),
-                             auth=('user', self.GITHUB_API_KEY)).json()
-            if len(j) == 0:
-                break
-            json += j
-            i += 1
+        commits = self._run(self._async_commit_history(owner, repo, 'date',
+                                                       ttl=self.SHORT_CACHE_TTL))
 
-        df = pd.DataFrame.from_dict({i: json[i]['commit']['author']['date']
-                                     for i in range(len(json))}, orient='index')
-        df.columns = ['created_at']
-        df['created_at'] = pd.to_datetime(df['created_at']).dt.normalize()
-        df = df.groupby('created_at').size().reset_index(name='count')
+        dates = np.fromiter(commits, dtype='U25', count=len(commits))
+        df = self._count_per_day(dates)
 
         return df
 
     @annotate(tag='contributors')
+    @_cached_metric
     def contributors(self, owner, repo):
         """
         List of contributors and their contributions.
@@ -95,14 +727,16 @@ class GitHubAPI(object):
         :param repo: The name of the repo
         :return: DataFrame consisting of contributors and their contributions
         """
-        url = 'https://api.github.com/repos/{}/{}/contributors'.format(owner, repo)
-        json = requests.get(url, auth=('user', self.GITHUB_API_KEY)).json()
+        url = 'https://api.github.com/repos/{}/{}/contributors?per_page=100'.format(owner, repo)
+        contributors = self._run(self._async_paginate(url, ttl=self.LONG_CACHE_TTL,
+                                                      fields=('login', 'contributions')))
 
-        df = pd.DataFrame(json, columns=['login', 'contributions'])
+        df = pd.DataFrame(contributors, columns=['login', 'contributions'])
 
         return df
 
     @annotate(tag='lines-of-code-changed')
+    @_cached_metric
     def lines_of_code_changed(self, owner, repo=None):
         """
         Timeseries of the count of lines added, deleted, and the net change each week
@@ -114,19 +748,24 @@ class GitHubAPI(object):
         # get the data we need from the GitHub API
         # see <project_root>/augur/githubapi.py for examples using the GraphQL API
         url = "https://api.github.com/repos/{}/{}/stats/code_frequency".format(owner, repo)
-        json = requests.get(url, auth=('user', self.GITHUB_API_KEY)).json()
-        # get our data into a dataframe
-        df = pd.DataFrame(json, columns=['date', 'additions', 'deletions'])
+        # raises on the 202 GitHub sends while it is still computing the statistics,
+        # so the metric cache doesn't hold on to an empty frame; call again shortly
+        weeks = orjson.loads(self._cached_get(url, ttl=self.LONG_CACHE_TTL))
+        weeks = np.array(weeks, dtype='i8').reshape(-1, 3)
         # all timeseries metrics need a 'date' column
-        df['date'] = pd.to_datetime(df['date'], unit='s', infer_datetime_format=True)
+        date = weeks[:, 0].astype('datetime64[s]').astype('datetime64[D]').astype('datetime64[ns]')
         # normalize our data and create useful aggregates
-        df['deletions'] = df['deletions'] * -1
-        df['delta'] = df['additions'] - df['deletions']
-        df['total_lines'] = df['delta'].cumsum()
+        additions = weeks[:, 1]
+        deletions = -weeks[:, 2]
+        delta = additions - deletions
+        # get our data into a dataframe
+        df = pd.DataFrame({'date': date, 'additions': additions, 'deletions': deletions,
+                           'delta': delta, 'total_lines': delta.cumsum()})
         # return the dataframe
         return df
 
     @annotate(tag='open-issues')
+    @_cached_metric
     def open_issues(self, owner, repo):
         """
         Timeseries of the number of issues opened per day.
@@ -136,21 +775,11 @@ class GitHubAPI(object):
         :return: DatFrame with number of issues opened per day.
         """
 
-        url = 'https://api.github.com/repos/{}/{}/issues?state=all'.format(owner, repo)
-        issues = []
-
-        while True:
-            response = requests.get(url, auth=('user', self.GITHUB_API_KEY))
-            issues += response.json()
-
-            if 'next' not in response.links:
-                break
-
-            url = response.links['next']['url']
+        url = 'https://api.github.com/repos/{}/{}/issues?state=all&per_page=100'.format(owner, repo)
+        issues = self._run(self._async_paginate(url, ttl=self.SHORT_CACHE_TTL,
+                                                fields=('created_at',)))
 
-        df = pd.DataFrame(issues, columns=['created_at'])
-        df['created_at'] = pd.to_datetime(df['created_at']).dt.normalize()
-        df = df.groupby('created_at').size().reset_index(name='count')
+        df = self._count_per_day([issue['created_at'] for issue in issues])
 
         return df
 
@@ -176,6 +805,7 @@ class GitHubAPI(object):
     #####################################
 
     @annotate(tag='bus-factor')
+    @_cached_metric
     def bus_factor(self, owner, repo, threshold=50):
         """
         Calculates bus factor by adding up percentages from highest to lowest until they exceed threshold
@@ -184,69 +814,19 @@ class GitHubAPI(object):
         :param repo: repo name
         :param threshold: Default 50;
         """
-        cursor = ""
-        url = "https://api.github.com/graphql"
-        commit_count = []
-        hasNextPage = True
-        threshold = threshold / 100
-        while hasNextPage:
-            query = {"query" :
-                     """
-                        query{
-                          repository(name: "%s", owner: "%s") {
-                            ref(qualifiedName: "master") {
-                              target {
-                                ... on Commit {
-                                  id
-                                  history(first: 100%s) {
-                                    pageInfo {
-                                      hasNextPage
-                                    }
-                                    edges {
-                                      cursor
-                                      node {
-                                        author {
-                                          email
-                                        }
-                                      }
-                                    }
-                                  }
-                                }
-                              }
-                            }
-                          }
-                        }
-                        """ % (repo, owner, cursor)
-            }
-            r = requests.post(url, auth=requests.auth.HTTPBasicAuth('user', self.GITHUB_API_KEY), json=query)
-            raw = r.text
-            data = json.loads(json.loads(json.dumps(raw)))
-            hasNextPage = data['data']['repository']['ref']['target']['history']['pageInfo']['hasNextPage']
-            commits = data['data']['repository']['ref']['target']['history']['edges']
-            for i in commits:
-                commit_count.append({'email' : i['node']['author']['email']})
-            cursor = ", after: \"%s\"" % (commits[-1]['cursor'])
-
-
-        df = pd.DataFrame(commit_count)
+        emails = self._run(self._async_commit_history(owner, repo, 'email',
+                                                      ttl=self.SHORT_CACHE_TTL))
 
-        total = df.email.count()
+        # commits without an author email don't count towards anyone
+        _, counts = np.unique(np.array([email for email in emails if email is not None]),
+                              return_counts=True)
+        counts.sort()
+        pct = counts / counts.sum() * 100
 
-        df = df.groupby(['email']).email.count() / df.groupby(['email']).email.count().sum() * 100
-
-        i = 0
-        for num in df.sort_values(ascending=False).cumsum():
-            i = i + 1
-            if num >= threshold:
-                break
-        worst = i
-
-        j = 0
-        for num in df.sort_values(ascending=True).cumsum():
-            j = j + 1
-            if num >= threshold:
-                break
-        best = j
+        # number of contributors, starting from the most (worst) or the least (best)
+        # active, whose percentages add up to the threshold
+        worst = int(min(np.searchsorted(pct[::-1].cumsum(), threshold) + 1, len(pct)))
+        best = int(min(np.searchsorted(pct.cumsum(), threshold) + 1, len(pct)))
 
         bus_factor = [{'worst': worst, 'best' : best}]
 
@@ -255,23 +835,21 @@ class GitHubAPI(object):
 
     def contributors_gender(self, owner, repo=None):
         contributors = self.api.get_repo((owner + "/" + repo)).get_contributors()
-        names = pd.DataFrame(columns=['name'])
-        i = 0
-        for contributor in contributors:
-            if contributor.name is not None:
-                names.loc[i] = [contributor.name.split()[0]]
-                i += 1
-        genderized = names.merge(LocalCSV.name_gender, how='inner', on=['name'])
+        names = pd.DataFrame({'name': [contributor.name.split()[0] for contributor in contributors
+                                       if contributor.name and contributor.name.strip()]})
+        names['gender'] = names['name'].map(self._NAME_GENDER)
+        genderized = names.dropna(subset=['gender']).reset_index(drop=True)
         return genderized
 
     def code_reviews(self, owner, repo=None):
-            url = 'https://api.github.com/repos/{}/{}/pulls'.format(owner,repo)
-            json = requests.get(url, auth=('user',key )).json()
+            url = 'https://api.github.com/repos/{}/{}/pulls?per_page=100'.format(owner,repo)
+            pulls = self._run(self._async_paginate(url, ttl=self.SHORT_CACHE_TTL,
+                                                   fields=('number', 'state', 'created_at')))
 
             dicts = []
             pullNums = []
 
-            for item in json:
+            for item in pulls:
                 info = {}
                 #repoID
                 info['pullNum'] = item['number']
@@ -281,12 +859,14 @@ class GitHubAPI(object):
                 dicts.append(info)
                 pullNums.append(item['number'])
 
-            countReviews = []
-            for index in range(0,len(pullNums)):
-                         url2='https://api.github.com/repos/{}/{}/pulls/{}/reviews'.format(owner,repo,pullNums[index])
+            url2 = 'https://api.github.com/repos/{}/{}/pulls/'.format(owner, repo)
 
-                j = requests.get(url2, auth=('user', self.GITHUB_API_KEY)).json()
-                countReviews = np.append(countReviews, len(j))
+            async def fetch_reviews():
+                # the review lookups are independent, so run them side by side
+                return await asyncio.gather(*[self._async_paginate(url2 + str(pullNum) + '/reviews?per_page=100',
+                                                                   ttl=self.SHORT_CACHE_TTL, fields=('id',))
+                                              for pullNum in pullNums])
 
+            countReviews = [len(reviews) for reviews in self._run(fetch_reviews())]
 
             return pd.DataFrame(dicts).join(pd.DataFrame(data=countReviews, columns=['num_reviews']))